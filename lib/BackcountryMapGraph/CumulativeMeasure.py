@@ -10,67 +10,23 @@ class CumulativeMeasure(object):
     __slots__ = ['_tab']
 
     @classmethod
-    def GetRootAs(cls, buf, offset=0):
-        n = flatbuffers.encode.Get(flatbuffers.packer.uoffset, buf, offset)
-        x = CumulativeMeasure()
-        x.Init(buf, n + offset)
-        return x
+    def SizeOf(cls):
+        return 12
 
-    @classmethod
-    def GetRootAsCumulativeMeasure(cls, buf, offset=0):
-        """This method is deprecated. Please switch to GetRootAs."""
-        return cls.GetRootAs(buf, offset)
     # CumulativeMeasure
     def Init(self, buf, pos):
         self._tab = flatbuffers.table.Table(buf, pos)
 
     # CumulativeMeasure
-    def CumulativeDistance(self):
-        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
-        if o != 0:
-            return self._tab.Get(flatbuffers.number_types.Float64Flags, o + self._tab.Pos)
-        return 0.0
-
+    def CumulativeDistance(self): return self._tab.Get(flatbuffers.number_types.Float32Flags, self._tab.Pos + flatbuffers.number_types.UOffsetTFlags.py_type(0))
     # CumulativeMeasure
-    def CumulativeGain(self):
-        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(6))
-        if o != 0:
-            return self._tab.Get(flatbuffers.number_types.Float64Flags, o + self._tab.Pos)
-        return 0.0
-
+    def CumulativeGain(self): return self._tab.Get(flatbuffers.number_types.Float32Flags, self._tab.Pos + flatbuffers.number_types.UOffsetTFlags.py_type(4))
     # CumulativeMeasure
-    def CumulativeLoss(self):
-        o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
-        if o != 0:
-            return self._tab.Get(flatbuffers.number_types.Float64Flags, o + self._tab.Pos)
-        return 0.0
-
-def CumulativeMeasureStart(builder):
-    builder.StartObject(3)
-
-def Start(builder):
-    CumulativeMeasureStart(builder)
-
-def CumulativeMeasureAddCumulativeDistance(builder, cumulativeDistance):
-    builder.PrependFloat64Slot(0, cumulativeDistance, 0.0)
-
-def AddCumulativeDistance(builder, cumulativeDistance):
-    CumulativeMeasureAddCumulativeDistance(builder, cumulativeDistance)
-
-def CumulativeMeasureAddCumulativeGain(builder, cumulativeGain):
-    builder.PrependFloat64Slot(1, cumulativeGain, 0.0)
-
-def AddCumulativeGain(builder, cumulativeGain):
-    CumulativeMeasureAddCumulativeGain(builder, cumulativeGain)
-
-def CumulativeMeasureAddCumulativeLoss(builder, cumulativeLoss):
-    builder.PrependFloat64Slot(2, cumulativeLoss, 0.0)
-
-def AddCumulativeLoss(builder, cumulativeLoss):
-    CumulativeMeasureAddCumulativeLoss(builder, cumulativeLoss)
-
-def CumulativeMeasureEnd(builder):
-    return builder.EndObject()
-
-def End(builder):
-    return CumulativeMeasureEnd(builder)
+    def CumulativeLoss(self): return self._tab.Get(flatbuffers.number_types.Float32Flags, self._tab.Pos + flatbuffers.number_types.UOffsetTFlags.py_type(8))
+
+def CreateCumulativeMeasure(builder, cumulativeDistance, cumulativeGain, cumulativeLoss):
+    builder.Prep(4, 12)
+    builder.PrependFloat32(cumulativeLoss)
+    builder.PrependFloat32(cumulativeGain)
+    builder.PrependFloat32(cumulativeDistance)
+    return builder.Offset()
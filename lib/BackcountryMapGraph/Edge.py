@@ -42,7 +42,7 @@ class Edge(object):
     def Weight(self):
         o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(8))
         if o != 0:
-            return self._tab.Get(flatbuffers.number_types.Float64Flags, o + self._tab.Pos)
+            return self._tab.Get(flatbuffers.number_types.Float32Flags, o + self._tab.Pos)
         return 0.0
 
     # Edge
@@ -77,8 +77,7 @@ class Edge(object):
         o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(12))
         if o != 0:
             x = self._tab.Vector(o)
-            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 4
-            x = self._tab.Indirect(x)
+            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 12
             from BackcountryMapGraph.CumulativeMeasure import CumulativeMeasure
             obj = CumulativeMeasure()
             obj.Init(self._tab.Bytes, x)
@@ -102,8 +101,7 @@ class Edge(object):
         o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(14))
         if o != 0:
             x = self._tab.Vector(o)
-            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 4
-            x = self._tab.Indirect(x)
+            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 12
             from BackcountryMapGraph.CumulativeMeasure import CumulativeMeasure
             obj = CumulativeMeasure()
             obj.Init(self._tab.Bytes, x)
@@ -141,7 +139,7 @@ def AddEndNodeId(builder, endNodeId):
     EdgeAddEndNodeId(builder, endNodeId)
 
 def EdgeAddWeight(builder, weight):
-    builder.PrependFloat64Slot(2, weight, 0.0)
+    builder.PrependFloat32Slot(2, weight, 0.0)
 
 def AddWeight(builder, weight):
     EdgeAddWeight(builder, weight)
@@ -165,7 +163,7 @@ def AddMeasuresForward(builder, measuresForward):
     EdgeAddMeasuresForward(builder, measuresForward)
 
 def EdgeStartMeasuresForwardVector(builder, numElems):
-    return builder.StartVector(4, numElems, 4)
+    return builder.StartVector(12, numElems, 4)
 
 def StartMeasuresForwardVector(builder, numElems):
     return EdgeStartMeasuresForwardVector(builder, numElems)
@@ -177,7 +175,7 @@ def AddMeasuresReverse(builder, measuresReverse):
     EdgeAddMeasuresReverse(builder, measuresReverse)
 
 def EdgeStartMeasuresReverseVector(builder, numElems):
-    return builder.StartVector(4, numElems, 4)
+    return builder.StartVector(12, numElems, 4)
 
 def StartMeasuresReverseVector(builder, numElems):
     return EdgeStartMeasuresReverseVector(builder, numElems)
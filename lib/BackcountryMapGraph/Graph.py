@@ -29,8 +29,7 @@ class Graph(object):
         o = flatbuffers.number_types.UOffsetTFlags.py_type(self._tab.Offset(4))
         if o != 0:
             x = self._tab.Vector(o)
-            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 4
-            x = self._tab.Indirect(x)
+            x += flatbuffers.number_types.UOffsetTFlags.py_type(j) * 24
             from BackcountryMapGraph.Node import Node
             obj = Node()
             obj.Init(self._tab.Bytes, x)
@@ -87,7 +86,7 @@ def AddNodes(builder, nodes):
     GraphAddNodes(builder, nodes)
 
 def GraphStartNodesVector(builder, numElems):
-    return builder.StartVector(4, numElems, 4)
+    return builder.StartVector(24, numElems, 8)
 
 def StartNodesVector(builder, numElems):
     return GraphStartNodesVector(builder, numElems)
@@ -0,0 +1,21 @@
+import os
+
+# GDAL settings for both rasterio and the GDAL command line tools
+GDAL_CONFIG = {
+    "GDAL_CACHEMAX": 2048,
+    "GDAL_NUM_THREADS": "ALL_CPUS",
+    "VSI_CACHE": True,
+    "VSI_CACHE_SIZE": 67108864,
+    "CHECK_DISK_FREE_SPACE": False,
+}
+
+
+def gdal_subprocess_env() -> dict[str, str]:
+    """
+    Environment for GDAL command line tools with GDAL_CONFIG applied.
+    """
+    options = {
+        key: ("YES" if value else "NO") if isinstance(value, bool) else str(value)
+        for key, value in GDAL_CONFIG.items()
+    }
+    return {**os.environ, **options}
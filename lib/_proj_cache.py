@@ -0,0 +1,38 @@
+from functools import lru_cache
+from typing import Optional, Tuple
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from pyproj.aoi import AreaOfInterest
+
+
+@lru_cache(maxsize=128)
+def get_transformer(
+    src,
+    dst,
+    always_xy: bool = True,
+    area_of_interest: Optional[Tuple[float, float, float, float]] = None,
+) -> Transformer:
+    """
+    Get a cached pyproj Transformer between two CRS.
+
+    Building a Transformer makes PROJ parse both CRS definitions and pick a
+    transformation pipeline, so it is done once per distinct set of arguments.
+
+    :param src: Source CRS (EPSG code, "EPSG:xxxx" or PROJ string)
+    :param dst: Target CRS
+    :param area_of_interest: Optional (west, south, east, north) bounds in degrees,
+        used by PROJ to choose the best transformation for that area
+    :return: Transformer
+    """
+    aoi = AreaOfInterest(*area_of_interest) if area_of_interest else None
+    return Transformer.from_crs(src, dst, always_xy=always_xy, area_of_interest=aoi)
+
+
+def reproject(geometry, transformer: Transformer):
+    """Reproject every vertex of a geometry (or array of them) in a single vectorized PROJ call."""
+    return shapely.transform(
+        geometry,
+        lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])),
+    )
@@ -1,8 +1,11 @@
+from functools import lru_cache
 import json
 from pathlib import Path
 from typing import Iterable, Tuple, cast
 
 import gpxpy
+import numpy as np
+import shapely
 from shapely.geometry import (
     shape,
     GeometryCollection,
@@ -11,13 +14,40 @@ from shapely.geometry import (
     MultiLineString,
     MultiPolygon,
 )
-from shapely.ops import unary_union, transform
-from pyproj import Transformer
+from shapely.ops import unary_union
 
 from lib.BBox import BBox
+from lib._proj_cache import get_transformer, reproject
+
+try:
+    import cupy
+    import cuproj
+except ImportError:
+    cuproj = None
 
 # BUFFER_RADIUS = 500  # meters
 
+# Below this many vertices the host <-> device copies outweigh the GPU speedup
+GPU_MIN_VERTICES = 50_000
+
+
+@lru_cache(maxsize=128)
+def _gpu_transformer(utm_epsg: int):
+    """Cached cuProj WGS84 -> UTM transformer for the given zone."""
+    return cuproj.Transformer.from_crs("EPSG:4326", f"EPSG:{utm_epsg}")
+
+
+def _reproject_gpu(geometry, utm_epsg: int):
+    """Reproject a WGS84 geometry to UTM on the GPU with cuProj."""
+    transformer = _gpu_transformer(utm_epsg)
+
+    def to_utm(coords):
+        # cuProj follows the authority axis order (lat, lon) for EPSG:4326
+        x, y = transformer.transform(cupy.asarray(coords[:, 1]), cupy.asarray(coords[:, 0]))
+        return np.column_stack([cupy.asnumpy(x), cupy.asnumpy(y)])
+
+    return shapely.transform(geometry, to_utm)
+
 
 def _load_geometries(path: Path):
     """Load geometries from GeoJSON or GPX."""
@@ -49,18 +79,84 @@ def _load_gpx(path: Path):
 
     for track in gpx.tracks:
         for segment in track.segments:
-            coords = [(p.longitude, p.latitude) for p in segment.points]
+            coords = _dedupe_points(segment.points)
             if len(coords) >= 2:
                 geometries.append(LineString(coords))
 
     for route in gpx.routes:
-        coords = [(p.longitude, p.latitude) for p in route.points]
+        coords = _dedupe_points(route.points)
         if len(coords) >= 2:
             geometries.append(LineString(coords))
 
     return geometries
 
 
+def _merge_geometries(geometries):
+    """
+    Union the input geometries one connected cluster at a time.
+
+    Geometries are grouped with an STRtree so that disjoint clusters are never
+    tested against each other. The per-cluster unions are disjoint and are
+    simply collected into a multi-geometry.
+    """
+    if len(geometries) == 1:
+        return unary_union(geometries)
+
+    tree = shapely.STRtree(geometries)
+    left, right = tree.query(geometries, predicate="intersects")
+
+    parent = list(range(len(geometries)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+
+    clusters: dict[int, list] = {}
+    for i, geom in enumerate(geometries):
+        clusters.setdefault(find(i), []).append(geom)
+
+    if len(clusters) == 1:
+        return unary_union(geometries)
+
+    parts = shapely.get_parts([unary_union(cluster) for cluster in clusters.values()])
+    if all(isinstance(part, LineString) for part in parts):
+        return MultiLineString(list(parts))
+    if all(isinstance(part, Polygon) for part in parts):
+        return MultiPolygon(list(parts))
+    return GeometryCollection(list(parts))
+
+
+def _thin(geometry, tolerance: float):
+    """
+    Simplify lineal parts with plain Douglas-Peucker. Polygonal parts keep
+    their topology so ones smaller than the tolerance don't collapse to empty.
+    """
+    parts = shapely.get_parts(geometry)
+    is_line = np.isin(
+        shapely.get_type_id(parts),
+        [shapely.GeometryType.LINESTRING, shapely.GeometryType.MULTILINESTRING],
+    )
+    parts[is_line] = shapely.simplify(parts[is_line], tolerance, preserve_topology=False)
+    parts[~is_line] = shapely.simplify(parts[~is_line], tolerance, preserve_topology=True)
+    return GeometryCollection(list(parts))
+
+
+def _dedupe_points(points) -> list[Tuple[float, float]]:
+    """Drop consecutive repeated GPX points (e.g. a stationary receiver)."""
+    coords = []
+    for p in points:
+        if not coords or coords[-1] != (p.longitude, p.latitude):
+            coords.append((p.longitude, p.latitude))
+    return coords
+
+
 def create_buffer(file_path: str, buffer_radius) -> Tuple[Polygon, "BBox"]:
     """
     Create a buffer around GeoJSON or GPX geometries and compute a bounding box.
@@ -80,7 +176,7 @@ def create_buffer(file_path: str, buffer_radius) -> Tuple[Polygon, "BBox"]:
     if not geometries:
         raise ValueError("No geometries found in input file")
 
-    merged = unary_union(geometries)
+    merged = _merge_geometries(geometries)
 
     if not isinstance(
         merged,
@@ -95,19 +191,34 @@ def create_buffer(file_path: str, buffer_radius) -> Tuple[Polygon, "BBox"]:
         raise TypeError(f"Unsupported geometry type: {type(merged)}")
 
     lon, lat = merged.centroid.coords[0]
-    zone = int((lon + 180) / 6) + 1
-    utm_epsg = 32600 + zone if lat >= 0 else 32700 + zone
-    utm_crs = f"EPSG:{utm_epsg}"
-
-    to_utm = Transformer.from_crs(4326, utm_crs, always_xy=True).transform
-    to_wgs = Transformer.from_crs(utm_crs, 4326, always_xy=True).transform
 
-    merged_utm = transform(to_utm, merged)
-    buffer_utm = cast(
-        Polygon,
-        merged_utm.buffer(buffer_radius).simplify(200),
-    )
-    buffer = transform(to_wgs, buffer_utm)
+    # Azimuthal equidistant projection centered on the input keeps distances
+    # from the center exact, so the buffer radius can be applied in meters
+    local_crs = f"+proj=aeqd +lat_0={lat} +lon_0={lon} +units=m"
+    # Dense GPS tracks make GEOS buffering slow; thinning them first has
+    # no visible effect on a buffer hundreds of meters wide
+    tolerance = max(1.0, buffer_radius / 500)
+
+    thinned_local = None
+    if cuproj is not None and shapely.get_num_coordinates(merged) > GPU_MIN_VERTICES:
+        # cuProj only supports WGS84 <-> UTM, so the input is thinned in UTM
+        # and only the far smaller thinned geometry is moved into the AEQD
+        # frame, so the buffer is applied in the same projection with or
+        # without a GPU
+        zone = int((lon + 180) / 6) + 1
+        utm_epsg = 32600 + zone if lat >= 0 else 32700 + zone
+        try:
+            thinned_utm = _thin(_reproject_gpu(merged, utm_epsg), tolerance)
+            thinned_local = reproject(thinned_utm, get_transformer(f"EPSG:{utm_epsg}", local_crs))
+        except Exception as e:
+            # cupy/cuproj can import without a usable CUDA device
+            print(f"GPU reprojection unavailable, using CPU: {e}")
+
+    if thinned_local is None:
+        thinned_local = _thin(reproject(merged, get_transformer(4326, local_crs)), tolerance)
+
+    buffer_local = cast(Polygon, thinned_local.buffer(buffer_radius).simplify(200))
+    buffer = reproject(buffer_local, get_transformer(local_crs, 4326))
 
     minx, miny, maxx, maxy = buffer.bounds
 
@@ -1,22 +1,27 @@
 # An OpenTopograpghy key is required to fetch the global DEM
 # In the shell, set the OPENTOPOGRAPHY_API_KEY environment variable to the API key value
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import os
 from pathlib import Path
 import subprocess
 import warnings
+import numpy as np
 from bmi_topography import Topography
 import rasterio
-from rasterio.mask import mask
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
 from shapely.geometry import Polygon, mapping
 from lib.BBox import BBox
 from lib.create_buffer import create_buffer
+from lib._gdal_config import GDAL_CONFIG, gdal_subprocess_env
 from lib import constants
 
 CONTOUR_METER_INTERVAL = 10
 CONTOUR_METER_INDEX_INTERVAL = 100
 CONTOUR_FEET_INTERVAL = 20
 CONTOUR_FEET_INDEX_INTERVAL = 80
+M_TO_FT = 3.28084
 
 warnings.filterwarnings(
     "ignore",
@@ -45,47 +50,65 @@ def download_from_bbox(bbox: BBox) -> Path:
 def crop_dem_to_buffer(input_path: Path, buffer: Polygon, output_path: Path) -> None:
     """
     Crop a DEM raster to the extent of a buffer polygon and save the result.
+
+    The output is written one block at a time so the cropped raster never has
+    to fit in memory.
     """
     os.makedirs(str(output_path.parent), exist_ok=True)
     
     geom = [mapping(buffer)]
 
-    with rasterio.open(str(input_path)) as src:
-        out_image, out_transform = mask(src, geom, crop=True)
+    with rasterio.Env(**GDAL_CONFIG), rasterio.open(str(input_path)) as src:
+        window = geometry_window(src, geom)
+        nodata = src.nodata if src.nodata is not None else 0
         out_meta = src.meta.copy()
 
-    out_meta.update({
-        "driver": "GTiff",
-        "height": out_image.shape[1],
-        "width": out_image.shape[2],
-        "transform": out_transform
-    })
+        out_meta.update({
+            "driver": "GTiff",
+            "height": window.height,
+            "width": window.width,
+            "transform": src.window_transform(window),
+            "tiled": True,
+            "blockxsize": 256,
+            "blockysize": 256,
+            "compress": "DEFLATE",
+            # Horizontal differencing for integer DEMs, floating point predictor otherwise
+            "predictor": 3 if np.dtype(src.dtypes[0]).kind == "f" else 2,
+        })
 
-    with rasterio.open(str(output_path), "w", **out_meta) as dest:
-        dest.write(out_image)
+        with rasterio.open(str(output_path), "w", **out_meta) as dest:
+            for _, block in dest.block_windows(1):
+                src_block = Window(
+                    window.col_off + block.col_off,
+                    window.row_off + block.row_off,
+                    block.width,
+                    block.height,
+                )
+                data = src.read(window=src_block)
+                inside = geometry_mask(
+                    geom,
+                    out_shape=(block.height, block.width),
+                    transform=dest.window_transform(block),
+                    invert=True,
+                )
+                data[:, ~inside] = nodata
+                dest.write(data, window=block)
         
 def dem_to_feet(input_path: Path, output_path: Path):
     """
-    Executes gdal_calc.py via a subprocess to convert DEM units.
+    Converts DEM units from meters to feet, one raster block at a time.
     """
-    input_path = Path(input_path)
-    output_path = Path(output_path)
-
-    command = [
-        "gdal_calc",
-        "-A", str(input_path),
-        "--outfile", str(output_path),
-        "--calc", "A*3.28084",
-        "--overwrite"
-    ]
+    with rasterio.Env(**GDAL_CONFIG), rasterio.open(str(input_path)) as src:
+        profile = src.profile
+        profile.update(dtype="float32", predictor=3)
+        nodata = src.nodata if src.nodata is not None else 0
 
-    try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
-        return result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Error processing {input_path.name}:")
-        print(e.stderr)
-        raise
+        with rasterio.open(str(output_path), "w", **profile) as dst:
+            for _, window in src.block_windows(1):
+                # GDAL converts integer DEMs to float32 while reading, no extra copy
+                block = src.read(1, window=window, masked=True, out_dtype="float32")
+                block *= M_TO_FT
+                dst.write(block.filled(nodata), 1, window=window)
 
 def generate_hillshade(input_path: Path, output_path: Path, azimuth: int = 315, altitude: int = 45):
     """
@@ -98,11 +121,16 @@ def generate_hillshade(input_path: Path, output_path: Path, azimuth: int = 315,
         str(output_path),
         "-az", str(azimuth),
         "-alt", str(altitude),
-        "-of", "GTiff"
+        "-of", "GTiff",
+        "-co", "TILED=YES",
+        "-co", "BLOCKXSIZE=256",
+        "-co", "BLOCKYSIZE=256",
+        "-co", "COMPRESS=DEFLATE",
+        "-co", "PREDICTOR=2",
     ]
     
     try:
-        result = subprocess.run(command, check=True, capture_output=True, text=True)
+        result = subprocess.run(command, check=True, capture_output=True, text=True, env=gdal_subprocess_env())
         return result.stdout
     except subprocess.CalledProcessError as e:
         print(f"GDAL Error: {e.stderr}")
@@ -115,16 +143,20 @@ def generate_contours(input_path: Path, output_path: Path, interval: int, index_
     if output_path.exists():
         output_path.unlink()
         
-    temp_gpkg = output_path.with_suffix(".gpkg")
+    # Unindexed FlatGeobuf scratch file: unlike a GeoPackage it needs no
+    # SQLite R-tree build before it can be read back
+    temp_fgb = output_path.with_suffix(".raw.fgb")
     contour_cmd = [
         "gdal_contour",
         "-a", "elev",
+        "-f", "FlatGeobuf",
+        "-lco", "SPATIAL_INDEX=NO",
         str(input_path),
-        str(temp_gpkg),
+        str(temp_fgb),
         "-i", str(interval)
     ]
     try:
-        subprocess.run(contour_cmd, check=True, capture_output=True, text=True)
+        subprocess.run(contour_cmd, check=True, capture_output=True, text=True, env=gdal_subprocess_env())
         
         sql = f"SELECT *, CAST((CAST(elev AS INT) % {index_interval} = 0) AS INTEGER) AS is_index FROM contour"
         
@@ -132,20 +164,21 @@ def generate_contours(input_path: Path, output_path: Path, interval: int, index_
             "ogr2ogr",
             "-f", "FlatGeobuf",
             str(output_path),
-            str(temp_gpkg),
+            str(temp_fgb),
+            "-dialect", "SQLITE",
             "-sql", sql,
             "-nln", output_path.stem,
             "-overwrite"
         ]
         
-        subprocess.run(fgb_command, check=True, capture_output=True)
-        
-        if temp_gpkg.exists():
-            temp_gpkg.unlink()
+        subprocess.run(fgb_command, check=True, capture_output=True, env=gdal_subprocess_env())
         
     except subprocess.CalledProcessError as e:
         print(f"Error: {e.stderr}")
         raise
+    finally:
+        if temp_fgb.exists():
+            temp_fgb.unlink()
 
 def main(output_dir: Path, bbox: BBox, polygon: Polygon):
     print(f"{constants.YELLOW}Downloading DEM...{constants.RESET}")
@@ -155,14 +188,22 @@ def main(output_dir: Path, bbox: BBox, polygon: Polygon):
     cropped_dem_ft_path: Path = temp_dir / "cropped_feet.tif"
     print(f"{constants.YELLOW}Cropping DEM to buffer...{constants.RESET}")
     crop_dem_to_buffer(raw_dem_path, polygon, cropped_dem_m_path)
-    print(f"{constants.YELLOW}Generating hillshade...{constants.RESET}")
-    generate_hillshade(cropped_dem_m_path, temp_dir / "hillshade.tif")
-    print(f"{constants.YELLOW}Converting DEM into imperial units...{constants.RESET}")
-    dem_to_feet(cropped_dem_m_path, cropped_dem_ft_path)
-    print(f"{constants.YELLOW}Creating contour lines in meters...{constants.RESET}")
-    generate_contours(cropped_dem_m_path, temp_dir / "contour_meter.fgb", CONTOUR_METER_INTERVAL, CONTOUR_METER_INDEX_INTERVAL)
-    print(f"{constants.YELLOW}Creating contour lines in feet...{constants.RESET}")
-    generate_contours(cropped_dem_ft_path, temp_dir / "contour_feet.fgb", CONTOUR_FEET_INTERVAL, CONTOUR_FEET_INDEX_INTERVAL)
+    # These steps only read the cropped DEM and write disjoint outputs
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        print(f"{constants.YELLOW}Generating hillshade...{constants.RESET}")
+        hillshade = executor.submit(generate_hillshade, cropped_dem_m_path, temp_dir / "hillshade.tif")
+        print(f"{constants.YELLOW}Converting DEM into imperial units...{constants.RESET}")
+        feet = executor.submit(dem_to_feet, cropped_dem_m_path, cropped_dem_ft_path)
+        print(f"{constants.YELLOW}Creating contour lines in meters...{constants.RESET}")
+        contour_meter = executor.submit(generate_contours, cropped_dem_m_path, temp_dir / "contour_meter.fgb", CONTOUR_METER_INTERVAL, CONTOUR_METER_INDEX_INTERVAL)
+
+        feet.result()
+        print(f"{constants.YELLOW}Creating contour lines in feet...{constants.RESET}")
+        contour_feet = executor.submit(generate_contours, cropped_dem_ft_path, temp_dir / "contour_feet.fgb", CONTOUR_FEET_INTERVAL, CONTOUR_FEET_INDEX_INTERVAL)
+
+        for future in as_completed([hillshade, contour_meter, contour_feet]):
+            future.result()
+
     cropped_dem_m_path.unlink()
     cropped_dem_ft_path.unlink()
     
@@ -2,13 +2,17 @@ import json
 from pathlib import Path
 import geopandas as gpd
 import pandas as pd
-from shapely.geometry import LineString, mapping
+import pyogrio
+import shapely
 import numpy as np
 import networkx as nx
 import flatbuffers
-from lib.BackcountryMapGraph import Graph, Node, Edge, CumulativeMeasure
+from lib.BackcountryMapGraph import Graph, Node, Edge
 from lib import constants
 
+# Attribute columns read by build_graph to weight the edges
+GRAPH_COLUMNS = ["highway", "main_trail"]
+
 def load_data(dir: str):
     print(f"Loading layers from {dir}...")
     
@@ -17,8 +21,9 @@ def load_data(dir: str):
     roads_path = dir + "/temp/osm_layers/road.fgb"
     trails_path = dir + "/temp/osm_layers/trail.fgb"
     
-    roads = gpd.read_file(roads_path)
-    trails = gpd.read_file(trails_path)
+    # Only the columns build_graph uses are decoded; missing ones are skipped
+    roads = pyogrio.read_dataframe(roads_path, columns=GRAPH_COLUMNS)
+    trails = pyogrio.read_dataframe(trails_path, columns=GRAPH_COLUMNS)
     
     print(f" - Raw Roads loaded: {len(roads)}")
     print(f" - Raw Trails loaded: {len(trails)}")
@@ -36,18 +41,10 @@ def load_data(dir: str):
     # Filter for LineStrings only (drops Points/Polygons)
     gdf = gdf[gdf.geometry.type == "LineString"].copy()
     
-    def ensure_3d(line):
-        coords = []
-        for c in line.coords:
-            if len(c) == 3:
-                coords.append(c)
-            else:
-                coords.append((c[0], c[1], 0.0))
-        return LineString(coords)
-
-    gdf["geometry"] = gdf.geometry.map(ensure_3d)
+    # Add Z=0 to any 2D lines, keeping existing Z values
+    gdf["geometry"] = shapely.force_3d(gdf.geometry.values, z=0.0)
     gdf = gdf[gdf.geometry.notnull()]
-    gdf = gdf[gdf.geometry.is_valid]
+    gdf = gdf[shapely.is_valid(gdf.geometry.values)]
     
     print(f" - Final valid edges after processing: {len(gdf)}")
     
@@ -57,52 +54,76 @@ def build_graph(gdf: gpd.GeoDataFrame):
     """
     Builds:
       - networkx.Graph (weighted)
-      - node table: {node_id: (x, y, z)}
-      - edge table: list of dicts (ready for FlatBuffers)
+      - node table: (N, 3) array of (x, y, z), indexed by node id
+      - edge table: dict of per-edge arrays (ready for FlatBuffers); the
+        measures of edge i are rows offsets[i]:offsets[i + 1] of the
+        measures arrays
     """
 
     G = nx.Graph()
 
-    node_index = {}
-    nodes = {}
-    edges = []
-
-    next_node_id = 0
-
-    def node_key(x, y, z, tol=1e-6):
-        return (round(x / tol), round(y / tol), round(z / tol))
-
-    def get_node_id(x, y, z):
-        nonlocal next_node_id
-        key = node_key(x, y, z)
-        if key not in node_index:
-            node_index[key] = next_node_id
-            nodes[next_node_id] = (x, y, z)
-            next_node_id += 1
-        return node_index[key]
-
-    def compute_measures(coords):
-        dist = gain = loss = 0.0
-        measures = [(0.0, 0.0, 0.0)]
-
-        for i in range(1, len(coords)):
-            x1, y1, z1 = coords[i - 1]
-            x2, y2, z2 = coords[i]
-
-            seg_dist = np.hypot(x2 - x1, y2 - y1)
-            dz = z2 - z1
-
-            dist += seg_dist
-            if dz > 0:
-                gain += dz
-            else:
-                loss += -dz
+    geoms = gdf.geometry.values
+
+    # No lines means no endpoints to index; return an empty graph
+    if len(geoms) == 0:
+        edges = {
+            "start": np.empty(0, dtype=np.intp),
+            "end": np.empty(0, dtype=np.intp),
+            "weight": np.empty(0),
+            "geometry": np.empty(0, dtype=object),
+            "offsets": np.zeros(1, dtype=np.intp),
+            "measures_forward": np.empty((0, 3)),
+            "measures_reverse": np.empty((0, 3)),
+        }
+        return G, np.empty((0, 3)), edges
+
+    coords, line_index = shapely.get_coordinates(geoms, include_z=True, return_index=True)
+
+    # Index of the first and last vertex of every line in the flat coordinate array
+    starts = np.searchsorted(line_index, np.arange(len(geoms)))
+    ends = np.append(starts[1:], len(coords)) - 1
+
+    def node_key(points, tol=1e-6):
+        # Junctions are matched in plan view so a line without Z (padded to 0)
+        # still connects to one with elevations
+        keys = np.ascontiguousarray(np.round(points[:, :2] / tol).astype(np.int64))
+        # View each (x, y) row as one record so np.unique sorts a flat array
+        return keys.view([("x", np.int64), ("y", np.int64)]).ravel()
+
+    # Deduplicate all endpoints in one pass; node ids follow the sorted key order
+    # and each node keeps the coordinates of its first endpoint
+    endpoints = np.stack([coords[starts], coords[ends]], axis=1).reshape(-1, 3)
+    _, first, inverse = np.unique(node_key(endpoints), return_index=True, return_inverse=True)
+    endpoint_ids = inverse.reshape(-1, 2)
+    nodes = endpoints[first]
+
+    # Number of vertices in every line
+    counts = ends - starts + 1
+
+    def compute_measures(coords, line_index):
+        """
+        Cumulative (distance, gain, loss) at every vertex, restarting at each line.
+        """
+        same_line = line_index[1:] == line_index[:-1]
+        dz = np.diff(coords[:, 2])
+
+        steps = np.zeros((len(coords), 3))
+        steps[1:, 0] = np.where(same_line, np.hypot(np.diff(coords[:, 0]), np.diff(coords[:, 1])), 0.0)
+        steps[1:, 1] = np.where(same_line & (dz > 0), dz, 0.0)
+        steps[1:, 2] = np.where(same_line & (dz < 0), -dz, 0.0)
+
+        measures = np.cumsum(steps, axis=0)
+        measures -= np.repeat(measures[starts], counts, axis=0)
+        return measures
 
-            measures.append((dist, gain, loss))
+    forward = compute_measures(coords, line_index)
 
-        return measures
+    # Reverse measures at a vertex are the line totals minus the forward measures
+    # at its mirrored vertex, with gain and loss swapped
+    mirror = np.repeat(starts + ends, counts) - np.arange(len(coords))
+    reverse = np.repeat(forward[ends], counts, axis=0) - forward[mirror]
+    reverse = reverse[:, [0, 2, 1]]
 
-    
     TRAIL_FACTOR = {
         "path": 0.5, 
         "track" : 0.5, 
@@ -111,44 +132,84 @@ def build_graph(gdf: gpd.GeoDataFrame):
     
     MAIN_TRAIL_FACTOR = 0.1
 
-    for _, row in gdf.iterrows():
-        geom: LineString = row.geometry
-        coords = list(geom.coords)
+    lengths = shapely.length(geoms)
+
+    if "highway" in gdf.columns:
+        trail_factor = gdf["highway"].map(TRAIL_FACTOR).fillna(1.0).to_numpy()
+    else:
+        trail_factor = 1.0
+
+    # Check if this is a main trail directly from the properties
+    if "main_trail" in gdf.columns:
+        is_main_trail = (gdf["main_trail"] == "yes").to_numpy()
+    else:
+        is_main_trail = False
+    priority_factor = np.where(is_main_trail, MAIN_TRAIL_FACTOR, 1.0)
+
+    weights = lengths * trail_factor * priority_factor
+
+    edges = {
+        "start": endpoint_ids[:, 0],
+        "end": endpoint_ids[:, 1],
+        "weight": weights,
+        "geometry": np.asarray(geoms, dtype=object),
+        "offsets": np.append(starts, len(coords)),
+        "measures_forward": forward,
+        "measures_reverse": reverse,
+    }
 
-        a_id = get_node_id(*coords[0])
-        b_id = get_node_id(*coords[-1])
+    G.add_weighted_edges_from(zip(*endpoint_ids.T.tolist(), weights.tolist()))
 
-        length = geom.length
+    return G, nodes, edges
 
-        highway_type = row.get("highway", "")
-        trail_factor = TRAIL_FACTOR.get(highway_type, 1.0)
-        
-        # Check if this is a main trail directly from the properties
-        is_main_trail = row.get("main_trail", "") == "yes"
-        priority_factor = MAIN_TRAIL_FACTOR if is_main_trail else 1.0
 
-        weight = length * trail_factor * priority_factor
+NODE_DTYPE = np.dtype({
+    "names": ["id", "z", "x", "y"],
+    "formats": ["<u4", "<f4", "<f8", "<f8"],
+    "offsets": [0, 4, 8, 16],
+    "itemsize": Node.Node.SizeOf(),
+})
 
-        forward = compute_measures(coords)
-        reverse = compute_measures(coords[::-1])
 
-        edges.append({
-            "start": a_id,
-            "end": b_id,
-            "weight": weight,
-            "geometry": geom,
-            "measures_forward": forward,
-            "measures_reverse": reverse,
-        })
+def create_struct_vector(builder: flatbuffers.Builder, start_vector, data: np.ndarray):
+    """
+    Writes a vector of structs by copying the raw bytes of `data` in one go.
 
-        G.add_edge(a_id, b_id, weight=weight)
+    `start_vector` is the generated Start...Vector function, which sets the
+    element size and alignment. Each row of `data` must already have the
+    struct's little-endian memory layout.
+    """
+    raw = np.ascontiguousarray(data).tobytes()
 
-    return G, nodes, edges
+    start_vector(builder, len(data))
+    builder.head = builder.head - len(raw)
+    builder.Bytes[builder.head:builder.head + len(raw)] = raw
+    return builder.EndVector()
+
+
+def create_offset_vector(builder: flatbuffers.Builder, start_vector, offsets: list[int]):
+    """
+    Writes a vector of table references in one go.
+
+    FlatBuffers stores each element as the distance from the element itself
+    to its table, so the values are computed up front as if they had been
+    prepended one by one.
+    """
+    n = len(offsets)
+
+    start_vector(builder, n)
+    base = builder.Offset()
+    relative = base + 4 * (n - np.arange(n)) - np.asarray(offsets, dtype=np.int64)
+    raw = relative.astype("<u4").tobytes()
+
+    builder.head = builder.head - len(raw)
+    builder.Bytes[builder.head:builder.head + len(raw)] = raw
+    return builder.EndVector()
 
 
 def export_graph_flatbuffer(
-    nodes: dict[int, tuple[float, float, float]],
-    edges: list[dict],
+    nodes: np.ndarray,
+    edges: dict[str, np.ndarray],
     output_path: str,
 ):
     builder = flatbuffers.Builder(1024)
@@ -156,61 +217,45 @@ def export_graph_flatbuffer(
     # -----------------------------
     # Nodes
     # -----------------------------
-    node_offsets = []
-
-    for node_id, (x, y, z) in nodes.items():
-        Node.Start(builder)
-        Node.AddId(builder, node_id)
-        Node.AddX(builder, x)
-        Node.AddY(builder, y)
-        Node.AddZ(builder, z)
-        node_offsets.append(Node.End(builder))
+    # Node struct layout: id, z (float32), then x, y (float64)
+    node_records = np.empty(len(nodes), dtype=NODE_DTYPE)
+    node_records["id"] = np.arange(len(nodes))
+    node_records["z"] = nodes[:, 2]
+    node_records["x"] = nodes[:, 0]
+    node_records["y"] = nodes[:, 1]
 
-    Graph.StartNodesVector(builder, len(node_offsets))
-    for off in reversed(node_offsets):
-        builder.PrependUOffsetTRelative(off)
-    nodes_vec = builder.EndVector()
+    nodes_vec = create_struct_vector(builder, Graph.StartNodesVector, node_records)
 
     # -----------------------------
     # Edges
     # -----------------------------
     edge_offsets = []
 
-    for e in edges:
-        # Geometry (WKB, 3D)
-        geom: LineString = e["geometry"]
-        wkb_vec = builder.CreateByteVector(geom.wkb)
+    # Geometry (WKB, 3D), encoded for all edges in one call
+    wkbs = shapely.to_wkb(edges["geometry"], output_dimension=3)
 
-        def build_measures(measures):
-            m_offsets = []
-            for dist, gain, loss in measures:
-                CumulativeMeasure.Start(builder)
-                CumulativeMeasure.AddCumulativeDistance(builder, dist)
-                CumulativeMeasure.AddCumulativeGain(builder, gain)
-                CumulativeMeasure.AddCumulativeLoss(builder, loss)
-                m_offsets.append(CumulativeMeasure.End(builder))
+    # Cast the measures once; each edge then copies a contiguous slice
+    measures_forward = edges["measures_forward"].astype("<f4")
+    measures_reverse = edges["measures_reverse"].astype("<f4")
+    offsets = edges["offsets"].tolist()
 
-            builder.StartVector(4, len(m_offsets), 4)
-            for mo in reversed(m_offsets):
-                builder.PrependUOffsetTRelative(mo)
-            return builder.EndVector()
+    for i, (start, end, weight) in enumerate(zip(edges["start"].tolist(), edges["end"].tolist(), edges["weight"].tolist())):
+        wkb_vec = builder.CreateByteVector(wkbs[i])
 
-        forward_vec = build_measures(e["measures_forward"])
-        reverse_vec = build_measures(e["measures_reverse"])
+        lo, hi = offsets[i], offsets[i + 1]
+        forward_vec = create_struct_vector(builder, Edge.StartMeasuresForwardVector, measures_forward[lo:hi])
+        reverse_vec = create_struct_vector(builder, Edge.StartMeasuresReverseVector, measures_reverse[lo:hi])
 
         Edge.Start(builder)
-        Edge.AddStartNodeId(builder, e["start"])
-        Edge.AddEndNodeId(builder, e["end"])
-        Edge.AddWeight(builder, e["weight"])
+        Edge.AddStartNodeId(builder, start)
+        Edge.AddEndNodeId(builder, end)
+        Edge.AddWeight(builder, weight)
         Edge.AddGeometryWkb(builder, wkb_vec)
         Edge.AddMeasuresForward(builder, forward_vec)
         Edge.AddMeasuresReverse(builder, reverse_vec)
         edge_offsets.append(Edge.End(builder))
 
-    Graph.StartEdgesVector(builder, len(edge_offsets))
-    for off in reversed(edge_offsets):
-        builder.PrependUOffsetTRelative(off)
-    edges_vec = builder.EndVector()
+    edges_vec = create_offset_vector(builder, Graph.StartEdgesVector, edge_offsets)
 
     # -----------------------------
     # Graph root
@@ -227,43 +272,47 @@ def export_graph_flatbuffer(
     
 
 def export_debug_geojson(nodes, edges, output_path):
-    features = []
-
-    # 1. Export Nodes (Points)
-    for node_id, (x, y, z) in nodes.items():
-        features.append({
-            "type": "Feature",
-            "geometry": {
-                "type": "Point",
-                "coordinates": [x, y, z]
-            },
-            "properties": {
-                "type": "node",
-                "id": node_id,
-                "z": z
-            }
-        })
-
-    # 2. Export Edges (Lines)
-    for e in edges:
-        features.append({
-            "type": "Feature",
-            "geometry": mapping(e["geometry"]),
-            "properties": {
+    """
+    Writes nodes and edges as a GeoJSON FeatureCollection, one feature at a time.
+    """
+    # Edge geometries are encoded by GEOS in one call
+    edge_geometries = shapely.to_geojson(edges["geometry"])
+
+    def features():
+        # 1. Export Nodes (Points)
+        for node_id, (x, y, z) in enumerate(nodes.tolist()):
+            yield json.dumps({
+                "type": "Feature",
+                "geometry": {
+                    "type": "Point",
+                    "coordinates": [x, y, z]
+                },
+                "properties": {
+                    "type": "node",
+                    "id": node_id,
+                    "z": z
+                }
+            })
+
+        # 2. Export Edges (Lines)
+        for start, end, weight, geometry in zip(
+            edges["start"].tolist(), edges["end"].tolist(), edges["weight"].tolist(), edge_geometries
+        ):
+            properties = json.dumps({
                 "type": "edge",
-                "start": e["start"],
-                "end": e["end"],
-                "weight": e["weight"]
-            }
-        })
-
-    geojson = {
-        "type": "FeatureCollection",
-        "features": features
-    }
+                "start": start,
+                "end": end,
+                "weight": weight
+            })
+            yield f'{{"type": "Feature", "geometry": {geometry}, "properties": {properties}}}'
 
     with open(output_path, "w") as f:
-        json.dump(geojson, f)
+        f.write('{"type": "FeatureCollection", "features": [')
+        for i, feature in enumerate(features()):
+            if i:
+                f.write(", ")
+            f.write(feature)
+        f.write("]}")
     print(f"Debug GeoJSON written to: {output_path}")
     
 def main(output_dir: Path):
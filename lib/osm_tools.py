@@ -1,17 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import json
+import math
 import os
 from pathlib import Path
-from typing import Mapping, cast
+from typing import Iterable, Mapping, cast
 import geopandas
 import pandas as pd
 import requests
+import shapely
 from shapely import Polygon
+import numpy as np
 import osmnx
+import pyogrio
 import re
 from lib.create_buffer import create_buffer
+from lib._proj_cache import get_transformer, reproject
+from lib.tile_tools import ZOOM_LEVEL
 from lib import constants
 
 osmnx.settings.cache_folder = Path(__name__).parent / "osmnx_cache"
+osmnx.settings.use_cache = True
+# Let osmnx wait for a free Overpass slot before each query and give up on
+# a stalled request
+osmnx.settings.overpass_rate_limit = True
+osmnx.settings.requests_timeout = 180
+# Progress is printed by this module; keep osmnx's logger off the console
+osmnx.settings.log_console = False
+
+# Packed R-tree in every layer so tippecanoe and readers can seek by extent
+FGB_LAYER_OPTIONS = {"SPATIAL_INDEX": "YES"}
+
+# Matches state route refs like "VT 30", "NY 5"
+STATE_REF_RE = re.compile(r"^[A-Z]{2}\s\d+")
+# Network prefix of a ref, e.g. "I ", "US ", "VT "
+REF_PREFIX_RE = re.compile(r"^(I|US|[A-Z]{2})\s+")
 
 def get_relation_way_ids(relation_id: int, cache_dir: Path = Path(__name__).parent / "trail_relation_cache") -> set[int]:
     """
@@ -19,14 +42,21 @@ def get_relation_way_ids(relation_id: int, cache_dir: Path = Path(__name__).pare
     queries Overpass and saves the result.
     """
     cache_dir.mkdir(parents=True, exist_ok=True)
-    cache_file = cache_dir / f"relation_{relation_id}.json"
+    cache_file = cache_dir / f"relation_{relation_id}.npy"
+    legacy_cache_file = cache_file.with_suffix(".json")
 
     # 1. Try to load from cache
     if cache_file.exists():
         print(f"Loading relation {relation_id} from cache...")
-        with open(cache_file, "r") as f:
-            data = json.load(f)
-            return set(data)
+        return set(np.load(cache_file).tolist())
+
+    # Older caches were written as JSON lists; convert them on first use
+    if legacy_cache_file.exists():
+        print(f"Loading relation {relation_id} from cache...")
+        with open(legacy_cache_file, "r") as f:
+            way_ids = json.load(f)
+        np.save(cache_file, np.asarray(way_ids, dtype=np.int64))
+        return set(way_ids)
 
     # 2. Fetch from Overpass if cache doesn't exist
     print(f"Fetching relation {relation_id} from Overpass...")
@@ -51,9 +81,8 @@ def get_relation_way_ids(relation_id: int, cache_dir: Path = Path(__name__).pare
             if element['type'] == 'way'
         ]
         
-        # 3. Save to cache (as a list, since JSON doesn't support sets)
-        with open(cache_file, "w") as f:
-            json.dump(way_ids, f)
+        # 3. Save to cache as a flat int64 array
+        np.save(cache_file, np.asarray(way_ids, dtype=np.int64))
         
         return set(way_ids)
 
@@ -136,19 +165,203 @@ park_area_tags = {
     "protected_area": True,
 }    
 
+def merge_tags(tag_sets: Iterable[Mapping[str, bool | str | list[str]]]) -> dict[str, bool | list[str]]:
+    """
+    Combines several osmnx tag filters into one that matches any of them.
+    """
+    merged: dict[str, bool | list[str]] = {}
+    for tags in tag_sets:
+        for key, value in tags.items():
+            if value is True or merged.get(key) is True:
+                merged[key] = True
+                continue
+            values = cast(list[str], merged.setdefault(key, []))
+            values.extend(v for v in ([value] if isinstance(value, str) else value) if v not in values)
+    return merged
+
+def select_features(gdf: geopandas.GeoDataFrame, tags: Mapping[str, bool | str | list[str]]):
+    """
+    Returns the features matching any of the tags, the way osmnx filters a
+    query result, without the columns that are empty for that selection.
+    """
+    mask = pd.Series(False, index=gdf.index)
+    for key, value in tags.items():
+        if key not in gdf.columns:
+            continue
+        if value is True:
+            mask |= gdf[key].notna()
+        elif isinstance(value, str):
+            mask |= gdf[key] == value
+        else:
+            mask |= gdf[key].isin(value)
+    return gdf[mask].dropna(axis=1, how="all")
+
+LINE_TYPES = [shapely.GeometryType.LINESTRING, shapely.GeometryType.MULTILINESTRING]
+POLYGON_TYPES = [shapely.GeometryType.POLYGON, shapely.GeometryType.MULTIPOLYGON]
+# Vertex budget per line, enforced by re-simplifying with a larger tolerance
+MAX_VERTICES = 2000
+# At most 4x the base tolerance, which is one pixel at ZOOM_LEVEL (see below)
+MAX_TOLERANCE_DOUBLINGS = 2
+# Ground size of a pixel of a 256 px web mercator tile at zoom 0, at the equator
+EQUATOR_PIXEL_M = 156543.03
+
+def min_simplification_tolerance(latitude: float) -> float:
+    """
+    A quarter of a pixel at ZOOM_LEVEL, in metres. Detail finer than this is
+    merged by tippecanoe anyway, so simplifying below it is wasted work.
+    """
+    return EQUATOR_PIXEL_M * math.cos(math.radians(latitude)) / 2 ** ZOOM_LEVEL / 4
+
+def _coverage_mask(polygons: np.ndarray) -> np.ndarray:
+    """
+    Marks the polygons that can be coverage simplified: those in a group of
+    touching polygons that forms a valid coverage. Groups are disjoint, so
+    one overlap only rules out the polygons connected to it.
+    """
+    tree = shapely.STRtree(polygons)
+    left, right = tree.query(polygons, predicate="intersects")
+
+    parent = np.arange(len(polygons))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for a, b in zip(left.tolist(), right.tolist()):
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[root_a] = root_b
+
+    groups: dict[int, list[int]] = {}
+    for i in range(len(polygons)):
+        groups.setdefault(find(i), []).append(i)
+
+    # A lone polygon only has to be valid itself
+    mask = shapely.is_valid(polygons)
+    for members in groups.values():
+        if len(members) > 1:
+            mask[members] = shapely.coverage_is_valid(polygons[members])
+    return mask
+
+def simplify_geometries(
+    geometries,
+    tolerance: float,
+    max_vertices: int | None = MAX_VERTICES,
+    coverage: bool = False
+) -> np.ndarray:
+    """
+    Simplifies lines with plain Douglas-Peucker.
+
+    Polygons are only simplified with `coverage`, where a group of touching
+    polygons forms a valid coverage (no overlaps, matching shared edges);
+    those are simplified together with Visvalingam-Whyatt so neighbours keep
+    identical borders. Other polygons are left as they are: simplified one
+    at a time they would open gaps along shared borders that tippecanoe's
+    --detect-shared-borders can no longer match.
+
+    Lines left with more than `max_vertices` vertices are simplified again
+    from the original with a doubled tolerance, up to
+    MAX_TOLERANCE_DOUBLINGS times.
+    """
+    geometries = np.asarray(geometries)
+    simplified = geometries.copy()
+    type_ids = shapely.get_type_id(geometries)
+
+    if coverage:
+        in_coverage = np.flatnonzero(np.isin(type_ids, POLYGON_TYPES))
+        if len(in_coverage):
+            in_coverage = in_coverage[_coverage_mask(geometries[in_coverage])]
+            simplified[in_coverage] = shapely.coverage_simplify(geometries[in_coverage], tolerance)
+
+    is_line = np.isin(type_ids, LINE_TYPES)
+    simplified[is_line] = shapely.simplify(geometries[is_line], tolerance, preserve_topology=False)
+    if max_vertices is None:
+        return simplified
+
+    for _ in range(MAX_TOLERANCE_DOUBLINGS):
+        over_budget = is_line & (shapely.get_num_coordinates(simplified) > max_vertices)
+        if not over_budget.any():
+            break
+        tolerance *= 2
+        simplified[over_budget] = shapely.simplify(geometries[over_budget], tolerance, preserve_topology=False)
+    return simplified
+
+def fetch_features(
+    polygon: Polygon,
+    tags: Mapping[str, bool | str | list[str]],
+    cache_dir: Path = Path(__name__).parent / "features_cache"
+) -> geopandas.GeoDataFrame:
+    """
+    Queries Overpass for the features matching `tags`, clipped to `polygon`.
+    The parsed result is cached on disk, keyed by the polygon and the tags,
+    so reruns over the same area skip the download and the parsing.
+    """
+    key = hashlib.sha1(json.dumps({"polygon": polygon.wkb_hex, "tags": tags}, sort_keys=True).encode()).hexdigest()
+    cache_file = cache_dir / f"features_{key}.pkl"
+
+    if cache_file.exists():
+        print("Loading OSM features from cache...")
+        return pd.read_pickle(cache_file)
+
+    features = osmnx.features_from_polygon(polygon, dict(tags)).clip(polygon)
+
+    # Pickle keeps osmnx's (element, id) index, which the trail flag relies on
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    features.to_pickle(cache_file)
+    return features
+
 def download_features_to_layer(
     polygon: Polygon, 
     # layer_name: str, 
     tags: Mapping[str, bool | str | list[str]], 
     output_path: Path,
     edit_highway_refs = False,
-    way_ids: set[int] | None = None
-):
-    gdf = osmnx.features_from_polygon(polygon, dict(tags)).clip(polygon)
+    way_ids: set[int] | None = None,
+    features: geopandas.GeoDataFrame | None = None,
+    simplification_tolerance_m: float | None = None,
+    coverage: bool = False,
+    keep_columns: list[str] | None = None
+) -> int:
+    """
+    Writes the OSM features matching `tags` to a FlatGeobuf layer.
+
+    If `features` is given it must already be clipped to `polygon`, and the
+    layer is selected from it instead of querying Overpass. If
+    `simplification_tolerance_m` (metres) is given, lines are simplified
+    with it, raised to at least a quarter of a tile pixel at ZOOM_LEVEL,
+    before writing; `coverage` also simplifies the polygons of area layers
+    whose polygons tile the ground (see simplify_geometries). By default
+    geometries are written as downloaded and tippecanoe does the
+    simplification for rendering.
+
+    `keep_columns` limits the written attributes to those columns, including
+    derived ones such as "network" or "main_trail", plus osmnx's element and
+    id; by default every column with at least one value is written.
+
+    Returns the number of features written; nothing is written when no
+    feature matches. Reporting is left to the caller so layers processed
+    on worker threads don't interleave their output.
+    """
+    if features is None:
+        gdf = fetch_features(polygon, tags)
+    else:
+        gdf = select_features(features, tags)
     
     if gdf.empty:
-        print(f"Warning: No features found for {output_path.name}")
-        return
+        return 0
+    
+    # Drop sub-metre vertices; GEOS simplifies the whole array in one call.
+    # The tolerance is applied in metres around the buffer, so it means the
+    # same ground distance at any latitude
+    if simplification_tolerance_m is not None:
+        centroid = polygon.centroid
+        tolerance_m = max(simplification_tolerance_m, min_simplification_tolerance(centroid.y))
+        local_crs = f"+proj=aeqd +lat_0={centroid.y} +lon_0={centroid.x} +units=m"
+        local = reproject(gdf.geometry.values, get_transformer(4326, local_crs))
+        simplified = simplify_geometries(local, tolerance_m, coverage=coverage)
+        gdf["geometry"] = reproject(simplified, get_transformer(local_crs, 4326))
     
     # Add highway shield data
     if "highway" in gdf.columns and edit_highway_refs:
@@ -161,10 +374,16 @@ def download_features_to_layer(
     # If this is the trail layer, add the codes
     if way_ids:
         gdf = add_main_trail_flag(gdf, way_ids)
+
+    # Unused tag columns only cost FlatGeobuf and tile bytes
+    if keep_columns is not None:
+        gdf = gdf[[c for c in keep_columns if c in gdf.columns] + [gdf.geometry.name]]
         
     
     os.makedirs(str(output_path.parent), exist_ok=True) # Ensure directory exists
-    gdf.to_file(output_path, driver="FlatGeobuf")
+    # Keep osmnx's (element, id) index as columns, like GeoDataFrame.to_file did
+    pyogrio.write_dataframe(gdf.reset_index(), output_path, driver="FlatGeobuf", layer_options=FGB_LAYER_OPTIONS)
+    return len(gdf)
     
 def save_buffer_polygon(buffer: Polygon, output_path: Path):
     gdf = geopandas.GeoDataFrame(
@@ -175,43 +394,39 @@ def save_buffer_polygon(buffer: Polygon, output_path: Path):
     if output_path == None:
         os.makedirs('./out/layers/', exist_ok=True)
         output_path = f'./out/layers/buffer.fgb'
-    gdf.to_file(output_path, driver="FlatGeobuf")
-
-def derive_network(ref: str | None):
-    if not ref:
-        return None
-    # Handle the first part of a multi-ref like "11;VT 30"
-    primary_ref = ref.split(';')[0].strip()
-    
-    if primary_ref.startswith("I "):
-        return "us-interstate"
-    if primary_ref.startswith("US "):
-        return "us-highway"
-    # Matches "VT 30", "NY 5", etc.
-    if re.match(r"^[A-Z]{2}\s\d+", primary_ref):
-        return "us-state"
-    return "road" # Default for other references
-
-def clean_ref(ref: str | None):
-    if not ref:
-        return None
-    # Take the first ref and strip the network prefix (e.g., "VT 30" -> "30")
-    primary_ref = ref.split(';')[0].strip()
-    return re.sub(r"^(I|US|[A-Z]{2})\s+", "", primary_ref).strip()
-
-def ref_length(ref: str | None):
-    cleaned = clean_ref(ref)
-    return len(cleaned) if cleaned else None
+    pyogrio.write_dataframe(gdf, output_path, driver="FlatGeobuf", layer_options=FGB_LAYER_OPTIONS)
 
 def add_shield_fields(gdf: geopandas.GeoDataFrame):
+    """
+    Derives highway shield fields from the "ref" tag:
+    - network: us-interstate, us-highway, us-state or road
+    - ref: the first ref with its network prefix removed (e.g. "VT 30;11" -> "30")
+    - ref_length: number of characters in the cleaned ref
+    """
     gdf = gdf.copy()
 
     mask = gdf["ref"].notna()
     refs = gdf.loc[mask, "ref"].astype(str)
 
-    gdf.loc[mask, "network"] = refs.map(derive_network)
-    gdf.loc[mask, "ref"] = refs.map(clean_ref)
-    gdf.loc[mask, "ref_length"] = refs.map(ref_length)
+    # Handle the first part of a multi-ref like "11;VT 30"
+    primary_ref = refs.str.split(";").str[0].str.strip()
+    has_ref = refs.ne("")
+
+    network = np.select(
+        [
+            primary_ref.str.startswith("I "),
+            primary_ref.str.startswith("US "),
+            primary_ref.str.match(STATE_REF_RE),
+        ],
+        ["us-interstate", "us-highway", "us-state"],
+        default="road", # Default for other references
+    )
+    cleaned = primary_ref.str.replace(REF_PREFIX_RE, "", regex=True).str.strip()
+    lengths = cleaned.str.len()
+
+    gdf.loc[mask, "network"] = pd.Series(network, index=refs.index).where(has_ref)
+    gdf.loc[mask, "ref"] = cleaned.where(has_ref)
+    gdf.loc[mask, "ref_length"] = lengths.where(has_ref & (lengths > 0))
 
     return gdf
 
@@ -222,14 +437,41 @@ def main(output_dir: Path, polygon: Polygon, relation_id: int | None = None):
     if relation_id: print(f"{constants.YELLOW}Fetching relation member IDs for the tral id:{relation_id}...{constants.RESET}")
     way_ids = get_relation_way_ids(relation_id) if relation_id else None
     
+    # Road and trail geometry feeds the routing graph, so only the
+    # render-only layers are simplified
+    render_only = {"simplification_tolerance_m": 1.0}
+    layers = [
+        (road_tags, layer_dir / "road.fgb", {"edit_highway_refs": True, "way_ids": way_ids}),
+        (trail_tags, layer_dir / "trail.fgb", {"way_ids": way_ids}),
+        (landcover_tags, layer_dir / "landcover.fgb", {**render_only, "coverage": True}),
+        (park_area_tags, layer_dir / "park.fgb", {**render_only, "coverage": True}),
+        (hydro_tags, layer_dir / "hydro.fgb", render_only),
+        (railway_tags, layer_dir / "railway.fgb", render_only),
+        ({"building" : True}, layer_dir / "building.fgb", render_only),
+    ]
+
     print(f"{constants.YELLOW}Downloading OSM features...{constants.RESET}")
-    download_features_to_layer(polygon, road_tags, layer_dir / "road.fgb", edit_highway_refs=True, way_ids=way_ids)
-    download_features_to_layer(polygon, trail_tags, layer_dir / "trail.fgb", way_ids=way_ids)
-    download_features_to_layer(polygon, landcover_tags, layer_dir / "landcover.fgb")
-    download_features_to_layer(polygon, park_area_tags, layer_dir / "park.fgb")
-    download_features_to_layer(polygon, hydro_tags, layer_dir / "hydro.fgb")
-    download_features_to_layer(polygon, railway_tags, layer_dir / "railway.fgb")
-    download_features_to_layer(polygon, {"building" : True}, layer_dir / "building.fgb")
+    # One Overpass query for every layer; each layer is then selected from the result
+    features = fetch_features(polygon, merge_tags(tags for tags, _, _ in layers))
+
+    # Layers are post-processed and written independently, so they run concurrently
+    errors = []
+    with ThreadPoolExecutor(max_workers=len(layers)) as executor:
+        futures = {
+            executor.submit(download_features_to_layer, polygon, tags, path, features=features, **kwargs): path
+            for tags, path, kwargs in layers
+        }
+        # Results are reported from this thread only, one line per layer
+        for future in as_completed(futures):
+            name = futures[future].name
+            try:
+                if future.result() == 0:
+                    print(f"Warning: No features found for {name}")
+            except Exception as e:
+                print(f"{constants.RED}Failed to write {name}: {e}{constants.RESET}")
+                errors.append(e)
+    if errors:
+        raise errors[0]
     print(f"{constants.YELLOW}Saving buffer geometry...{constants.RESET}")
     save_buffer_polygon(polygon, layer_dir / "buffer.fgb")
 
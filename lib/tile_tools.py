@@ -1,65 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
 from pathlib import Path
-from glob import glob
-import shlex
 import subprocess
 
 from lib import constants
+from lib._gdal_config import gdal_subprocess_env
 
 ZOOM_LEVEL=14
 HILLSHADE_ZOOM=9
 OSM_SIMPLIFICATION=5
 
+# main() runs four tilers at once
+TILER_COUNT = 4
+
+def _tippecanoe_env(max_threads: int | None) -> dict[str, str] | None:
+    """
+    Environment capping tippecanoe at `max_threads`; None keeps the current
+    environment, where tippecanoe uses every core.
+    """
+    if max_threads is None:
+        return None
+    return {**os.environ, "TIPPECANOE_MAX_THREADS": str(max_threads)}
+
 def generate_hillshade_tiles(input_path: Path, output_path: Path):
-    temp_tif = input_path.parent / "temp.tif"
+    # The warp is only described in a VRT and runs while gdal_translate reads
+    # it, so the reprojected raster is never written to disk
+    temp_vrt = input_path.parent / "temp.vrt"
     commands = [
         [
             "gdalwarp",
+            "-of", "VRT",
+            "-overwrite",
+            "-wo", "NUM_THREADS=ALL_CPUS",
             "-t_srs", "EPSG:3857",
             "-srcnodata", "0",
             "-dstnodata", "0",
             "-dstalpha",
             str(input_path),
-            str(temp_tif),
+            str(temp_vrt),
         ],
         [
             "gdal_translate",
             "-of", "MBTiles",
             "-co", "TILE_FORMAT=WEBP",
             "-co", f"ZLEVEL={HILLSHADE_ZOOM}",
-            str(temp_tif),
+            str(temp_vrt),
             str(output_path),
         ],
         [
             "gdaladdo",
-            "-r", "nearest",
+            "-r", "average",
             str(output_path),
             "2", "4", "8", "16", "32", "64", "128", "256",
         ],
     ]
 
     for cmd in commands:
-        subprocess.run(cmd, check=True)
+        subprocess.run(cmd, check=True, env=gdal_subprocess_env())
     
-    if temp_tif.exists():
-        temp_tif.unlink()
+    if temp_vrt.exists():
+        temp_vrt.unlink()
 
-def generate_osm_tiles(layers_path: Path, output_path: Path):
-    input_files = layers_path.glob("*")
+def generate_osm_tiles(layers_path: Path, output_path: Path, compress_tiles: bool = True, max_threads: int | None = None):
+    """
+    Tiles every OSM layer file into one archive; each file becomes its own
+    vector tile layer. Pass compress_tiles=False when the tile server applies
+    its own compression, and max_threads to share the cores with other work.
+    """
+    # Sorted so tippecanoe always sees the layers in the same order
+    input_files = sorted(layers_path.glob("*.fgb"))
 
     if not input_files:
-        print(f"Error: No input files found")
+        print(f"Error: No input files found in {layers_path}")
         return
 
-    input_files_string = " ".join([shlex.quote(str(f)) for f in input_files])
-    
-    command = f'tippecanoe -o {str(output_path)} -z{str(ZOOM_LEVEL)} -f {input_files_string} --drop-densest-as-needed --simplification={str(OSM_SIMPLIFICATION)} --detect-shared-borders --read-parallel'
-    args = shlex.split(command)
+    command = [
+        "tippecanoe",
+        "-o", str(output_path),
+        f"-z{ZOOM_LEVEL}",
+        "-f", *map(str, input_files),
+        "--drop-densest-as-needed",
+        f"--simplification={OSM_SIMPLIFICATION}",
+        "--detect-shared-borders",
+        "--read-parallel",
+    ]
+    if not compress_tiles:
+        command.append("--no-tile-compression")
     try:
-        result = subprocess.run(
-            args,
-            check=True,
-            text=True  
-        )
+        subprocess.run(command, check=True, text=True, env=_tippecanoe_env(max_threads))
 
     except subprocess.CalledProcessError as e:
         print(f"Tippecanoe failed with exit code {e.returncode}")
@@ -67,7 +95,12 @@ def generate_osm_tiles(layers_path: Path, output_path: Path):
     except FileNotFoundError:
         print("\nError: tippecanoe command not found. Make sure it is installed and in your system PATH.")
 
-def generate_contour_tiles(input_path: Path, output_path: Path):
+def generate_contour_tiles(input_path: Path, output_path: Path, compress_tiles: bool = True, max_threads: int | None = None):
+    """
+    Tiles a contour layer. Pass compress_tiles=False when the tile server
+    applies its own compression, and max_threads to share the cores with
+    other work.
+    """
     command = [
         "tippecanoe",
         "-o", str(output_path),
@@ -78,21 +111,30 @@ def generate_contour_tiles(input_path: Path, output_path: Path):
         "--detect-shared-borders",
         "--read-parallel",
     ]
+    if not compress_tiles:
+        command.append("--no-tile-compression")
     try:
-        subprocess.run(command, check=True, text=True)
+        subprocess.run(command, check=True, text=True, env=_tippecanoe_env(max_threads))
     except subprocess.CalledProcessError as e:
         print(f"Tippecanoe failed with exit code {e.returncode}")
         print("Error Output:\n", e.stderr)
         
 def main(output_dir: Path):
-    print(f"{constants.YELLOW}Generating contour_meter.pmtiles...{constants.RESET}")
-    generate_contour_tiles(output_dir / "temp/contour_meter.fgb", output_dir / "contour_meter.pmtiles")
-    print(f"{constants.YELLOW}Generating contour_feet.pmtiles...{constants.RESET}")
-    generate_contour_tiles(output_dir / "temp/contour_feet.fgb", output_dir / "contour_feet.pmtiles")
-    print(f"{constants.YELLOW}Generating hillshade.mbtiles...{constants.RESET}")
-    generate_hillshade_tiles(output_dir / "temp/hillshade.tif", output_dir / "hillshade.mbtiles")
-    print(f"{constants.YELLOW}Generating osm.pmtiles...{constants.RESET}")
-    generate_osm_tiles(output_dir / "temp/osm_layers", output_dir / "osm.pmtiles")
+    # Each tileset is an independent subprocess with its own inputs and output,
+    # so each tippecanoe gets a share of the cores
+    max_threads = max(1, (os.cpu_count() or 1) // TILER_COUNT)
+    with ThreadPoolExecutor(max_workers=TILER_COUNT) as executor:
+        print(f"{constants.YELLOW}Generating contour_meter.pmtiles...{constants.RESET}")
+        contour_meter = executor.submit(generate_contour_tiles, output_dir / "temp/contour_meter.fgb", output_dir / "contour_meter.pmtiles", max_threads=max_threads)
+        print(f"{constants.YELLOW}Generating contour_feet.pmtiles...{constants.RESET}")
+        contour_feet = executor.submit(generate_contour_tiles, output_dir / "temp/contour_feet.fgb", output_dir / "contour_feet.pmtiles", max_threads=max_threads)
+        print(f"{constants.YELLOW}Generating hillshade.mbtiles...{constants.RESET}")
+        hillshade = executor.submit(generate_hillshade_tiles, output_dir / "temp/hillshade.tif", output_dir / "hillshade.mbtiles")
+        print(f"{constants.YELLOW}Generating osm.pmtiles...{constants.RESET}")
+        osm = executor.submit(generate_osm_tiles, output_dir / "temp/osm_layers", output_dir / "osm.pmtiles", max_threads=max_threads)
+
+        for future in as_completed([contour_meter, contour_feet, hillshade, osm]):
+            future.result()
 
 if __name__ == "__main__":
     output_dir = Path("./out3").resolve()